@@ -0,0 +1,31 @@
+# Ahead-of-time compilation of the backtest kernels
+# Run once at install time from this folder:  python _kernels_aot.py
+# This writes a backtest_kernels extension module next to backtest.py, which
+# backtest.py imports in place of the @njit versions so fresh processes pay no
+# JIT compile latency. sweep_thresholds uses parallel=True, which AOT compilation
+# does not support, so it stays JIT-compiled (with its on-disk cache).
+# A hash of the kernel sources is written alongside; backtest.py ignores the module
+# once the sources change, so re-run this after editing any of the exported kernels.
+# numba.pycc is deprecated upstream and may be removed in a future numba release.
+
+import os
+import sys
+from numba.pycc import CC
+
+# Make sure we compile the @njit Python sources, not a previously built module
+sys.modules['backtest_kernels'] = None
+import backtest
+
+cc = CC('backtest_kernels')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+cc.export('rolling_mean_std', 'UniTuple(f8[:], 2)(f8[:], i8)')(backtest.rolling_mean_std.py_func)
+cc.export('ffill_with_exit', 'i1[:](i1[:], b1[:])')(backtest.ffill_with_exit.py_func)
+cc.export('trade_stats', 'Tuple((i8, f8, f8, f8, f8))(i1[:], f4[:])')(backtest.trade_stats.py_func)
+cc.export('run_bt_fused', 'Tuple((f8, f8, f8, i8))(f8[:], i8, f8, f8, f8)')(backtest.run_bt_fused.py_func)
+
+if __name__ == "__main__":
+    cc.compile()
+    with open(os.path.join(cc.output_dir, backtest.AOT_HASH_FILE), 'w') as f:
+        f.write(backtest.kernel_source_hash())
+    print(f"Compiled backtest_kernels into {cc.output_dir}")
@@ -2,21 +2,66 @@
 # Enhancements:
 # - Fetch data directly from FRED (requires pandas_datareader; pip install if needed)
 # - Fallback to local CSVs if fetch fails
+# - Fetched rates cached on disk as Parquet (.cache/, refreshed daily)
 # - Add transaction costs (configurable, default 2 bps per trade)
 # - Accurate max drawdown calculation
 # - Additional metrics: Sortino ratio, number of trades, average trade duration, average win/loss, Kelly fraction
 # - Grid search optimization on in-sample period (2021-03-01 to 2023-12-31) to find best parameters (window, entry_z, exit_z) based on Sharpe
+# - Fast grid search: rolling stats computed once per window, all (entry_z, exit_z) pairs swept in one parallel numba kernel
+# - Random coarse search followed by a fine grid around the best point; invalid exit_z >= entry_z pairs skipped
+# - Random candidates pre-ranked by a quick Sharpe on the first 10% of the sample; only the top 8 are fully backtested
+# - Fused single-pass numba backtest (prices to metrics) for search calls; full per-day series only for reporting runs
 # - Apply best parameters to out-of-sample (2024-01-01 to 2025-11-28) and full period
-# - Improved visualization with entry/exit markers
+# - Improved visualization with entry/exit markers (--no-plot to skip, saved to PNG when headless)
 # - Regime start date configurable
 
+import argparse
+import hashlib
+import inspect
+import math
+import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 from datetime import datetime
+from itertools import product
+from data_cache import load_cached, save_cache
 
-# Function to fetch data (FRED or local)
+# Optional accelerators (fall back to pandas / pure Python if missing)
+try:
+    import bottleneck as bn
+    BOTTLENECK_AVAILABLE = True
+except ImportError:
+    BOTTLENECK_AVAILABLE = False
+
+try:
+    from joblib import Parallel, delayed
+    JOBLIB_AVAILABLE = True
+except ImportError:
+    JOBLIB_AVAILABLE = False
+
+try:
+    from numba import njit, prange
+except ImportError:
+    prange = range
+
+    def njit(*args, **kwargs):
+        # No-op decorator so kernels still run (un-jitted) without numba
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+# Function to fetch data (disk cache, else FRED or local)
 def fetch_data(start_date='2021-03-01', end_date='2025-11-28'):
+    df = load_cached(start_date, end_date)
+    if df is None:
+        df = _load_rates(start_date, end_date)
+    else:
+        print(f"Loaded cached data. Rows: {len(df)}")
+    df['MYR_SGD'] = df['USD_MYR'] / df['USD_SGD']
+    return df.loc[start_date:end_date]
+
+# Raw USD_MYR/USD_SGD rates from FRED, falling back to local CSVs
+def _load_rates(start_date, end_date):
     try:
         import pandas_datareader.data as web
         print("Fetching from FRED...")
@@ -24,6 +69,7 @@ def fetch_data(start_date='2021-03-01', end_date='2025-11-28'):
         sgd = web.DataReader('DEXSIUS', 'fred', start_date, end_date)['DEXSIUS']
         df = pd.concat([myr, sgd], axis=1).dropna()
         df.columns = ['USD_MYR', 'USD_SGD']
+        save_cache(df, start_date, end_date)
     except (ImportError, ModuleNotFoundError) as e:
         print(f"pandas_datareader not available or incompatible: {e}")
         print("Loading local CSVs...")
@@ -37,82 +83,194 @@ def fetch_data(start_date='2021-03-01', end_date='2025-11-28'):
         sgd = pd.read_csv('../data/usd_sgd.csv', parse_dates=['observation_date'], index_col='observation_date')['DEXSIUS']
         df = pd.concat([myr, sgd], axis=1).dropna()
         df.columns = ['USD_MYR', 'USD_SGD']
-    df['MYR_SGD'] = df['USD_MYR'] / df['USD_SGD']
-    return df.loc[start_date:end_date]
+    return df
 
-# Backtest function (returns metrics dict)
-def run_backtest(data, window, entry_z, exit_z, trans_cost=0.0002):
-    data = data.copy()
-    data['log_spread'] = np.log(data['MYR_SGD'])
+# Single-pass rolling mean/std (Welford update with sliding-window removal, ddof=1)
+@njit(cache=True, nogil=True)
+def rolling_mean_std(x, w):
+    n = x.size
+    mean_out = np.full(n, np.nan)
+    std_out = np.full(n, np.nan)
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    for i in range(n):
+        # Add the incoming sample
+        count += 1
+        delta = x[i] - mean
+        mean += delta / count
+        m2 += delta * (x[i] - mean)
+        # Remove the sample leaving the window
+        if i >= w:
+            old = x[i - w]
+            count -= 1
+            delta = old - mean
+            mean -= delta / count
+            m2 -= delta * (old - mean)
+        if i >= w - 1:
+            mean_out[i] = mean
+            std_out[i] = np.sqrt(max(m2, 0.0) / (w - 1))
+    return mean_out, std_out
+
+# Rolling mean/std of a 1-D array (bottleneck if available, else Welford kernel)
+# bottleneck rejects window > len(x); the kernel returns all-NaN for that case.
+def _move_mean_std(x, window):
+    if BOTTLENECK_AVAILABLE and window <= x.size:
+        mean = bn.move_mean(x, window, min_count=window)
+        std = bn.move_std(x, window, min_count=window, ddof=1)
+        return mean, std
+    return rolling_mean_std(x, window)
+
+# Trade statistics in one pass over signal and strategy returns
+# A trade's return runs from its entry day up to the next entry, so the exit-day
+# return and cost (booked one bar after the signal changes) are included.
+@njit(cache=True, nogil=True)
+def trade_stats(signal, strategy_ret):
+    n = signal.size
+    num_trades = 0
+    runs = 0
+    dur_sum = 0
+    duration = 0
+    in_trade = False
+    trade_ret = 0.0
+    wins_n = 0
+    wins_sum = 0.0
+    losses_n = 0
+    losses_sum = 0.0
+    for i in range(n):
+        pos = signal[i] != 0
+        last = i == n - 1
+        if pos and (i == 0 or signal[i - 1] == 0):
+            if i > 0:
+                num_trades += 1  # Entry point
+            in_trade = True
+            trade_ret = 0.0
+        if in_trade and not np.isnan(strategy_ret[i]):
+            trade_ret += strategy_ret[i]
+        # Position run ends here
+        if pos:
+            duration += 1
+            if last or signal[i + 1] == 0:
+                dur_sum += duration
+                runs += 1
+                duration = 0
+        # Trade segment ends where the next entry begins (or at the end of data)
+        if in_trade and (last or (not pos and signal[i + 1] != 0)):
+            if trade_ret > 0:
+                wins_n += 1
+                wins_sum += trade_ret
+            elif trade_ret < 0:  # Zero-return segments are not actual trades
+                losses_n += 1
+                losses_sum += trade_ret
+            in_trade = False
     
-    # Z-score
-    data['mean'] = data['log_spread'].rolling(window).mean()
-    data['std'] = data['log_spread'].rolling(window).std()
-    data['zscore'] = (data['log_spread'] - data['mean']) / data['std']
+    avg_duration = dur_sum / runs if runs > 0 else 0.0
+    n_closed = wins_n + losses_n
+    win_rate = wins_n / n_closed if n_closed > 0 else 0.0
+    avg_win = wins_sum / wins_n if wins_n > 0 else 0.0
+    avg_loss = losses_sum / losses_n if losses_n > 0 else -1.0  # Avoid div0
+    return num_trades, avg_duration, win_rate, avg_win, avg_loss
+
+# Per-window statistics shared by every (entry_z, exit_z) evaluation
+def precompute(myr_sgd, window):
+    myr_sgd = np.asarray(myr_sgd, dtype=np.float64)
+    log_spread = np.log(myr_sgd)
+    mean_arr, std_arr = _move_mean_std(log_spread, window)
+    return {
+        'myr_sgd': myr_sgd,
+        'log_spread': log_spread,
+        'mean': mean_arr,
+        'std': std_arr,
+        # Analytics arrays in float32: Sharpe only needs ~4 significant digits
+        'zscore': ((log_spread - mean_arr) / std_arr).astype(np.float32),
+        'spread_ret': np.diff(log_spread, prepend=np.nan).astype(np.float32)  # First day has no prior price
+    }
+
+# Hold positions between signals: exit band -> flat, new entry -> take it, else keep previous
+@njit(cache=True, nogil=True)
+def ffill_with_exit(raw, exit_mask):
+    signal = np.empty(raw.size, dtype=np.int8)
+    prev = 0
+    for i in range(raw.size):
+        if exit_mask[i]:
+            prev = 0
+        elif raw[i] != 0:
+            prev = raw[i]
+        signal[i] = prev
+    return signal
+
+# Backtest function on a MYR/SGD price array (returns metrics dict)
+# With return_series=True also returns the per-day arrays as a dict (for plotting)
+def run_backtest(myr_sgd, window, entry_z, exit_z, trans_cost=0.0002, return_series=False):
+    return evaluate(precompute(myr_sgd, window), entry_z, exit_z, trans_cost, return_series)
+
+# Evaluate entry/exit thresholds on precomputed window statistics
+def evaluate(pre, entry_z, exit_z, trans_cost=0.0002, return_series=False):
+    log_spread = pre['log_spread']
+    zscore = pre['zscore']
+    spread_ret = pre['spread_ret']
+    n = log_spread.size
     
-    # Signals
-    data['signal'] = 0
-    data.loc[data['zscore'] > entry_z, 'signal'] = -1  # Short spread
-    data.loc[data['zscore'] < -entry_z, 'signal'] = 1   # Long spread
-    data.loc[abs(data['zscore']) < exit_z, 'signal'] = 0  # Exit
+    # Signals: +1 long spread below -entry_z, -1 short above entry_z (NaN z-scores give 0)
+    raw = (zscore < -entry_z).astype(np.int8) - (zscore > entry_z).astype(np.int8)
+    exit_mask = np.abs(zscore) < exit_z
+    signal = ffill_with_exit(raw, exit_mask)
     
-    data['signal'] = data['signal'].ffill().fillna(0)
+    # Returns, written into preallocated arrays (first day has no prior signal, so it stays NaN)
+    trade_cost = np.empty(n, dtype=np.float32)
+    trade_cost[:1] = np.nan
+    np.abs(np.diff(signal), out=trade_cost[1:])
+    trade_cost[1:] *= trans_cost
+    strategy_ret = np.empty(n, dtype=np.float32)
+    strategy_ret[:1] = np.nan
+    np.multiply(signal[:-1], spread_ret[1:], out=strategy_ret[1:])
+    strategy_ret[2:] -= trade_cost[1:-1]
+    ret = strategy_ret[1:]
     
-    # Returns
-    data['spread_ret'] = data['log_spread'].diff()
-    data['trade_cost'] = data['signal'].diff().abs() * trans_cost
-    data['strategy_ret'] = data['signal'].shift(1) * data['spread_ret'] - data['trade_cost'].shift(1).fillna(0)
+    # Cumulative (accumulated in float64)
+    cum_ret = np.empty(n)
+    cum_ret[:1] = np.nan
+    np.cumsum(ret, dtype=np.float64, out=cum_ret[1:])
     
-    # Cumulative
-    data['cum_ret'] = data['strategy_ret'].cumsum().dropna()
+    series = None
+    if return_series:
+        series = {
+            'MYR_SGD': pre['myr_sgd'],
+            'log_spread': log_spread,
+            'zscore': zscore,
+            'signal': signal,
+            'spread_ret': spread_ret,
+            'trade_cost': trade_cost,
+            'strategy_ret': strategy_ret,
+            'cum_ret': cum_ret
+        }
     
     # Metrics
-    if len(data['strategy_ret'].dropna()) < 10:
-        return {'sharpe': -np.inf}  # Invalid
+    if len(ret) < 10:
+        metrics = {'sharpe': -np.inf}  # Invalid
+        return (metrics, series) if return_series else metrics
     
     annual_factor = 252
-    total_return = data['strategy_ret'].sum()
-    cagr = np.exp(total_return * annual_factor / len(data)) - 1 if len(data) > 0 else 0
-    mean_ret = data['strategy_ret'].mean()
-    std_ret = data['strategy_ret'].std()
+    total_return = cum_ret[-1]
+    cagr = np.exp(total_return * annual_factor / n) - 1 if n > 0 else 0
+    mean_ret = ret.mean(dtype=np.float64)
+    std_ret = ret.std(ddof=1, dtype=np.float64)
     sharpe = mean_ret / std_ret * np.sqrt(annual_factor) if std_ret != 0 else 0
     
     # Sortino
-    downside_std = data['strategy_ret'][data['strategy_ret'] < 0].std()
+    downside = ret[ret < 0]
+    downside_std = downside.std(ddof=1, dtype=np.float64) if len(downside) > 1 else np.nan
     sortino = mean_ret / downside_std * np.sqrt(annual_factor) if downside_std != 0 else 0
     
     # Max DD
-    wealth = np.exp(data['cum_ret'].fillna(0))
-    peak = wealth.cummax()
+    wealth = np.exp(cum_ret)
+    wealth[0] = 1.0
+    peak = np.maximum.accumulate(wealth)
     drawdown = (wealth / peak) - 1
     max_dd = drawdown.min()
     
     # Trades
-    positions = data['signal'] != 0
-    trade_starts = (positions.diff() > 0)  # Entry points
-    num_trades = trade_starts.sum()
-    
-    # Trade durations
-    trade_durations = []
-    current = 0
-    for i in range(len(positions)):
-        if positions.iloc[i]:
-            current += 1
-        else:
-            if current > 0:
-                trade_durations.append(current)
-                current = 0
-    if current > 0:
-        trade_durations.append(current)
-    avg_duration = np.mean(trade_durations) if trade_durations else 0
-    
-    # Avg win/loss
-    cum_position = positions.cumsum()  # Unique group per trade block
-    trade_returns = data['strategy_ret'].groupby(cum_position).sum()
-    trade_returns = trade_returns[trade_returns != 0]  # Only actual trades
-    win_rate = (trade_returns > 0).mean() if len(trade_returns) > 0 else 0
-    avg_win = trade_returns[trade_returns > 0].mean() if any(trade_returns > 0) else 0
-    avg_loss = trade_returns[trade_returns < 0].mean() if any(trade_returns < 0) else -1  # Avoid div0
+    num_trades, avg_duration, win_rate, avg_win, avg_loss = trade_stats(signal, strategy_ret)
     
     # Kelly (assuming loss=1 unit, win=b units)
     if avg_loss != 0 and avg_win > 0:
@@ -134,7 +292,275 @@ def run_backtest(data, window, entry_z, exit_z, trans_cost=0.0002):
         'avg_loss': avg_loss,
         'kelly': kelly
     }
-    return metrics, data
+    
+    return (metrics, series) if return_series else metrics
+
+# Sharpe for every (entry_z, exit_z) cell at one window, shape (len(entries), len(exits))
+# Each cell runs the signal/cost/return recurrence of evaluate() with scalar accumulators
+# (Welford mean/variance) and no allocations; entry thresholds are spread across threads.
+# Cells with exit_z >= entry_z never settle cleanly and are scored -inf.
+@njit(cache=True, nogil=True, parallel=True)
+def sweep_thresholds(zscore, spread_ret, entries, exits, trans_cost):
+    n = zscore.size
+    annual_factor = 252
+    out = np.empty((entries.size, exits.size))
+    for i in prange(entries.size):
+        for j in range(exits.size):
+            entry_z = entries[i]
+            exit_z = exits[j]
+            if exit_z >= entry_z or n - 1 < 10:
+                out[i, j] = -np.inf
+                continue
+            sig = 0       # signal[t-1]
+            sig_prev = 0  # signal[t-2]
+            count = 0
+            mean = 0.0
+            m2 = 0.0
+            for t in range(n):
+                z = zscore[t]
+                if abs(z) < exit_z:
+                    new_sig = 0
+                elif z > entry_z:
+                    new_sig = -1
+                elif z < -entry_z:
+                    new_sig = 1
+                else:
+                    new_sig = sig
+                if t >= 1:
+                    r = sig * spread_ret[t]
+                    if t >= 2:
+                        r -= abs(sig - sig_prev) * trans_cost
+                    count += 1
+                    delta = r - mean
+                    mean += delta / count
+                    m2 += delta * (r - mean)
+                sig_prev = sig
+                sig = new_sig
+            std = np.sqrt(m2 / (count - 1))
+            out[i, j] = mean / std * np.sqrt(annual_factor) if std != 0 else 0.0
+    return out
+
+# Fused backtest for search calls: one pass from prices to metrics, nothing materialized
+# Log price, rolling Welford mean/std (ring buffer for the sample leaving the window),
+# z-score, signal, cost, strategy return, drawdown and trade count are all scalar state.
+# Returns (sharpe, sortino, max_dd, num_trades) with the same definitions as evaluate().
+@njit(cache=True, nogil=True)
+def run_bt_fused(myr_sgd, window, entry_z, exit_z, trans_cost):
+    n = myr_sgd.size
+    annual_factor = 252
+    ring = np.empty(window)
+    count = 0
+    roll_mean = 0.0
+    roll_m2 = 0.0
+    prev_log = 0.0
+    sig = 0       # signal[i-1]
+    sig_prev = 0  # signal[i-2]
+    n_ret = 0
+    mean = 0.0
+    m2 = 0.0
+    n_down = 0
+    down_mean = 0.0
+    down_m2 = 0.0
+    cum = 0.0
+    peak = 0.0
+    max_dd = 0.0
+    num_trades = 0
+    for i in range(n):
+        x = math.log(myr_sgd[i])
+        
+        # Rolling mean/std over the last `window` log prices
+        count += 1
+        delta = x - roll_mean
+        roll_mean += delta / count
+        roll_m2 += delta * (x - roll_mean)
+        if i >= window:
+            old = ring[i % window]
+            count -= 1
+            delta = old - roll_mean
+            roll_mean -= delta / count
+            roll_m2 -= delta * (old - roll_mean)
+        ring[i % window] = x
+        roll_std = math.sqrt(max(roll_m2, 0.0) / (window - 1)) if i >= window - 1 else 0.0
+        z = (x - roll_mean) / roll_std if roll_std > 0 else np.nan  # Flat window: hold position
+        
+        # Signal
+        if abs(z) < exit_z:
+            new_sig = 0
+        elif z > entry_z:
+            new_sig = -1
+        elif z < -entry_z:
+            new_sig = 1
+        else:
+            new_sig = sig
+        if i >= 1 and new_sig != 0 and sig == 0:
+            num_trades += 1
+        
+        # Strategy return (previous signal, cost of the previous change)
+        if i >= 1:
+            r = sig * (x - prev_log)
+            if i >= 2:
+                r -= abs(sig - sig_prev) * trans_cost
+            n_ret += 1
+            delta = r - mean
+            mean += delta / n_ret
+            m2 += delta * (r - mean)
+            if r < 0:
+                n_down += 1
+                delta = r - down_mean
+                down_mean += delta / n_down
+                down_m2 += delta * (r - down_mean)
+            cum += r
+            peak = max(peak, cum)
+            max_dd = min(max_dd, math.exp(cum - peak) - 1)
+        
+        sig_prev = sig
+        sig = new_sig
+        prev_log = x
+    
+    if n_ret < 10:
+        return -np.inf, 0.0, 0.0, num_trades  # Invalid
+    std = math.sqrt(m2 / (n_ret - 1))
+    sharpe = mean / std * math.sqrt(annual_factor) if std != 0 else 0.0
+    if n_down > 1:
+        downside_std = math.sqrt(down_m2 / (n_down - 1))
+        sortino = mean / downside_std * math.sqrt(annual_factor) if downside_std != 0 else 0.0
+    else:
+        sortino = np.nan
+    return sharpe, sortino, max_dd, num_trades
+
+# Ahead-of-time compiled kernels (built with `python _kernels_aot.py`) skip JIT warmup entirely.
+# The build writes a hash of these kernels' sources next to the module; if the sources
+# have changed since, the build is stale and the @njit versions are used instead.
+AOT_KERNELS = (rolling_mean_std, ffill_with_exit, trade_stats, run_bt_fused)
+AOT_HASH_FILE = 'backtest_kernels.sha256'
+
+def kernel_source_hash():
+    source = ''.join(inspect.getsource(getattr(k, 'py_func', k)) for k in AOT_KERNELS)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+def _load_aot():
+    try:
+        import backtest_kernels as aot
+    except ImportError:
+        return None
+    try:
+        with open(os.path.join(os.path.dirname(aot.__file__), AOT_HASH_FILE)) as f:
+            built_hash = f.read().strip()
+    except OSError:
+        built_hash = None
+    if built_hash != kernel_source_hash():
+        print("backtest_kernels is out of date with backtest.py (re-run _kernels_aot.py); using JIT kernels.")
+        return None
+    return aot
+
+# AOT entry points have fixed signatures and don't check dtypes, so only inputs that
+# already match them go to the AOT code; anything else takes the JIT path unchanged.
+def _is_vec(a, dtype):
+    return isinstance(a, np.ndarray) and a.ndim == 1 and a.dtype == dtype and a.flags.c_contiguous
+
+_aot = _load_aot()
+if _aot is not None:
+    _jit_rolling_mean_std, _jit_ffill_with_exit, _jit_trade_stats, _jit_run_bt_fused = AOT_KERNELS
+    
+    def rolling_mean_std(x, w):
+        if _is_vec(x, np.float64):
+            return _aot.rolling_mean_std(x, w)
+        return _jit_rolling_mean_std(x, w)
+    
+    def ffill_with_exit(raw, exit_mask):
+        if _is_vec(raw, np.int8) and _is_vec(exit_mask, np.bool_):
+            return _aot.ffill_with_exit(raw, exit_mask)
+        return _jit_ffill_with_exit(raw, exit_mask)
+    
+    def trade_stats(signal, strategy_ret):
+        if _is_vec(signal, np.int8) and _is_vec(strategy_ret, np.float32):
+            return _aot.trade_stats(signal, strategy_ret)
+        return _jit_trade_stats(signal, strategy_ret)
+    
+    def run_bt_fused(myr_sgd, window, entry_z, exit_z, trans_cost):
+        if _is_vec(myr_sgd, np.float64):
+            return _aot.run_bt_fused(myr_sgd, window, entry_z, exit_z, trans_cost)
+        return _jit_run_bt_fused(myr_sgd, window, entry_z, exit_z, trans_cost)
+
+# Sharpe for the given (entry_z, exit_z) pairs at one window
+def _sweep_window(pre, en, ex, trans_cost=0.0002):
+    entries = np.unique(en)
+    exits = np.unique(ex)
+    sharpe = sweep_thresholds(pre['zscore'], pre['spread_ret'], entries, exits, trans_cost)
+    return sharpe[np.searchsorted(entries, en), np.searchsorted(exits, ex)]
+
+# Sharpe for arbitrary (window, entry_z, exit_z) combos (returns one row per combo)
+# Combos are grouped by window so each window's statistics are computed once and all
+# its threshold pairs are evaluated in one sweep_thresholds() call. Windows are independent,
+# so they can be spread across processes with n_jobs, but each sweep takes milliseconds
+# and already runs on prange threads, so worker start-up only pays off for very large
+# window lists; keep the default n_jobs=1 otherwise. Pass a dict as cache to keep
+# the per-window precompute() results for reuse.
+def evaluate_combos(myr_sgd, combos, trans_cost=0.0002, n_jobs=1, cache=None):
+    if cache is None:
+        cache = {}
+    by_window = {}
+    for w, en, ex in combos:
+        by_window.setdefault(w, []).append((en, ex))
+    for w in by_window:
+        if w not in cache:
+            cache[w] = precompute(myr_sgd, w)
+    tasks = [(w, np.array([p[0] for p in pairs]), np.array([p[1] for p in pairs]))
+             for w, pairs in by_window.items()]
+    
+    if JOBLIB_AVAILABLE and n_jobs != 1:
+        sharpes = Parallel(n_jobs=n_jobs, backend='loky')(
+            delayed(_sweep_window)(cache[w], en, ex, trans_cost) for w, en, ex in tasks
+        )
+    else:
+        sharpes = [_sweep_window(cache[w], en, ex, trans_cost) for w, en, ex in tasks]
+    
+    rows = {'window': [], 'entry_z': [], 'exit_z': [], 'sharpe': []}
+    for (w, en, ex), sharpe in zip(tasks, sharpes):
+        rows['window'].extend([w] * len(en))
+        rows['entry_z'].extend(en)
+        rows['exit_z'].extend(ex)
+        rows['sharpe'].extend(sharpe)
+    return pd.DataFrame(rows)
+
+# Exhaustive grid search (pairs with exit_z >= entry_z never settle cleanly and are skipped)
+def grid_search(myr_sgd, windows, entries, exits, trans_cost=0.0002, n_jobs=1, cache=None):
+    combos = [(w, en, ex) for w, en, ex in product(windows, entries, exits) if ex < en]
+    return evaluate_combos(myr_sgd, combos, trans_cost, n_jobs, cache)
+
+# Cheap Sharpe proxy on the head of the sample (at least two windows long so the z-score settles)
+# Pass n_head to score several candidates on the same rows so their proxies are comparable.
+def quick_sharpe(myr_sgd, window, entry_z, exit_z, frac=0.1, trans_cost=0.0002, n_head=None):
+    if n_head is None:
+        n_head = max(int(len(myr_sgd) * frac), 2 * window)
+    head = np.ascontiguousarray(myr_sgd[:n_head], dtype=np.float64)
+    return run_bt_fused(head, window, entry_z, exit_z, trans_cost)[0]
+
+# Random search over the parameter lists, then a 3x3x3 fine grid around the best point
+# With top_k set, the random candidates are first ranked by quick_sharpe() on one shared
+# head (sized for the largest candidate window) and only the best top_k get a full
+# in-sample backtest.
+def search(myr_sgd, windows, entries, exits, n_iter=20, top_k=8, trans_cost=0.0002, n_jobs=1, cache=None, seed=None):
+    rng = np.random.default_rng(seed)
+    valid = [(w, en, ex) for w, en, ex in product(windows, entries, exits) if ex < en]
+    picks = np.sort(rng.choice(len(valid), size=min(n_iter, len(valid)), replace=False))
+    candidates = [valid[i] for i in picks]
+    if top_k is not None and len(candidates) > top_k:
+        n_head = max(int(len(myr_sgd) * 0.1), 2 * max(w for w, _, _ in candidates))
+        quick = np.array([quick_sharpe(myr_sgd, *p, trans_cost=trans_cost, n_head=n_head) for p in candidates])
+        keep = np.sort(np.argsort(-quick, kind='stable')[:top_k])
+        candidates = [candidates[i] for i in keep]
+    coarse = evaluate_combos(myr_sgd, candidates, trans_cost, n_jobs, cache)
+    
+    best = coarse.loc[coarse['sharpe'].idxmax()]
+    w, en, ex = int(best['window']), best['entry_z'], best['exit_z']
+    fine_windows = [v for v in (w - 15, w, w + 15) if v >= 2]
+    fine_entries = [en - 0.125, en, en + 0.125]
+    fine_exits = [v for v in (ex - 0.125, ex, ex + 0.125) if v >= 0]
+    fine = grid_search(myr_sgd, fine_windows, fine_entries, fine_exits, trans_cost, n_jobs, cache)
+    
+    results = pd.concat([coarse, fine], ignore_index=True)
+    return results.drop_duplicates(['window', 'entry_z', 'exit_z'], ignore_index=True)
 
 # Print metrics table
 def print_metrics(period_name, metrics):
@@ -151,8 +577,32 @@ def print_metrics(period_name, metrics):
     print(f"Avg loss return: {metrics['avg_loss']:.4f}")
     print(f"Kelly fraction: {metrics['kelly']:.2f}")
 
-# Visualization
-def plot_results(data, entry_z, exit_z):
+# Positional indices of long entries, short entries and exits (edge detection on the signal)
+def trade_markers(signal):
+    pos = signal != 0
+    starts = np.flatnonzero(pos[1:] & ~pos[:-1]) + 1
+    exits = np.flatnonzero(~pos[1:] & pos[:-1]) + 1
+    return starts[signal[starts] == 1], starts[signal[starts] == -1], exits
+
+# matplotlib's built-in file-only backends
+_NON_INTERACTIVE_BACKENDS = ('agg', 'cairo', 'pdf', 'pgf', 'ps', 'svg', 'template')
+
+# Visualization (shows the figure on an interactive matplotlib backend, else saves it to a PNG)
+# matplotlib falls back to Agg by itself when no display is available, so the
+# resolved backend is what decides the default rather than any platform check.
+def plot_results(data, entry_z, exit_z, show=None):
+    # Lazy import: pyplot is slow to load and only needed here
+    import matplotlib
+    if show is False:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    interactive = plt.get_backend().lower() not in _NON_INTERACTIVE_BACKENDS
+    if show is None:
+        show = interactive
+    elif show and not interactive:
+        print(f"Cannot show the plot on the non-interactive '{plt.get_backend()}' backend; saving it instead.")
+        show = False
+    
     plt.figure(figsize=(14, 8))
     
     # Equity curve
@@ -165,16 +615,16 @@ def plot_results(data, entry_z, exit_z):
     # Z-score with signals
     plt.subplot(2, 1, 2)
     data['zscore'].plot(color='gray', alpha=0.7, label='Z-score')
-    data['log_spread'].rolling(20).mean().plot(color='black', label='20d MA Spread')
+    ma_20, _ = _move_mean_std(data['log_spread'].to_numpy(), 20)
+    pd.Series(ma_20, index=data.index).plot(color='black', label='20d MA Spread')
     
     # Entries/Exits
-    entry_long = data[(data['signal'].shift(1) == 0) & (data['signal'] == 1)].index
-    entry_short = data[(data['signal'].shift(1) == 0) & (data['signal'] == -1)].index
-    exits = data[(data['signal'].shift(1) != 0) & (data['signal'] == 0)].index
+    entry_long, entry_short, exits = trade_markers(data['signal'].to_numpy())
+    zscore = data['zscore'].to_numpy()
     
-    plt.scatter(entry_long, data['zscore'].loc[entry_long], color='green', marker='^', label='Long Entry')
-    plt.scatter(entry_short, data['zscore'].loc[entry_short], color='red', marker='v', label='Short Entry')
-    plt.scatter(exits, data['zscore'].loc[exits], color='black', marker='x', label='Exit')
+    plt.scatter(data.index[entry_long], zscore[entry_long], color='green', marker='^', label='Long Entry')
+    plt.scatter(data.index[entry_short], zscore[entry_short], color='red', marker='v', label='Short Entry')
+    plt.scatter(data.index[exits], zscore[exits], color='black', marker='x', label='Exit')
     
     plt.axhline(entry_z, color='red', linestyle='--')
     plt.axhline(-entry_z, color='green', linestyle='--')
@@ -184,10 +634,18 @@ def plot_results(data, entry_z, exit_z):
     plt.legend()
     
     plt.tight_layout()
-    plt.show()
+    if show:
+        plt.show()
+    else:
+        plt.savefig('backtest_results.png')
+        print("Plot saved as 'backtest_results.png'.")
 
 # Main
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest the MYR/SGD mean-reversion strategy")
+    parser.add_argument('--no-plot', action='store_true', help="skip plotting (headless / batch runs)")
+    args = parser.parse_args()
+    
     df = fetch_data()
     
     # Split samples
@@ -195,34 +653,31 @@ if __name__ == "__main__":
     out_sample = df.loc['2024-01-01':'2025-11-28']
     full_sample = df
     
-    # Grid search params
+    # Search space (random coarse search, then fine grid around the best point)
     windows = [30, 60, 90, 120]
     entries = [1.5, 1.75, 2.0, 2.25]
     exits = [0.0, 0.25, 0.5, 0.75]
     
-    best_sharpe = -np.inf
-    best_params = None
-    for w in windows:
-        for en in entries:
-            for ex in exits:
-                metrics, _ = run_backtest(in_sample, w, en, ex)
-                if metrics['sharpe'] > best_sharpe:
-                    best_sharpe = metrics['sharpe']
-                    best_params = (w, en, ex)
+    in_sample_stats = {}  # precompute() results keyed by window
+    results = search(in_sample['MYR_SGD'].to_numpy(), windows, entries, exits, cache=in_sample_stats, seed=42)
+    best = results.loc[results['sharpe'].idxmax()]
+    best_sharpe = best['sharpe']
+    best_params = (int(best['window']), best['entry_z'], best['exit_z'])
     
     print(f"\nBest In-Sample Params (max Sharpe {best_sharpe:.3f}): window={best_params[0]}, entry_z={best_params[1]}, exit_z={best_params[2]}")
     
     # Run on in-sample
-    in_metrics, _ = run_backtest(in_sample, *best_params)
+    in_metrics = evaluate(in_sample_stats[best_params[0]], best_params[1], best_params[2])
     print_metrics("In-Sample (2021-03-01 to 2023-12-31)", in_metrics)
     
     # Run on out-of-sample
-    out_metrics, out_data = run_backtest(out_sample, *best_params)
+    out_metrics, out_series = run_backtest(out_sample['MYR_SGD'].to_numpy(), *best_params, return_series=True)
     print_metrics("Out-of-Sample (2024-01-01 to 2025-11-28)", out_metrics)
     
     # Run on full
-    full_metrics, full_data = run_backtest(full_sample, *best_params)
+    full_metrics = run_backtest(full_sample['MYR_SGD'].to_numpy(), *best_params)
     print_metrics("Full Period (2021-03-01 to 2025-11-28)", full_metrics)
     
     # Plot out-of-sample as example
-    plot_results(out_data, best_params[1], best_params[2])
\ No newline at end of file
+    if not args.no_plot:
+        plot_results(pd.DataFrame(out_series, index=out_sample.index), best_params[1], best_params[2])
\ No newline at end of file
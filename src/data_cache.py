@@ -0,0 +1,45 @@
+# Shared on-disk cache for FX rate data
+# fetch_data() in main.py and backtest.py both persist the raw USD_MYR/USD_SGD
+# frame to one Parquet file, so repeated runs skip CSV parsing and FRED calls.
+# The file records the date range it was fetched for; any request inside that
+# range is served from it, so the two scripts share it despite different defaults.
+# Parquet needs pyarrow (or fastparquet); without it caching is silently skipped.
+
+import os
+import time
+import pandas as pd
+
+CACHE_DIR = '.cache'
+MAX_AGE_SECONDS = 24 * 60 * 60  # Refetch after one day
+
+def cache_path():
+    return os.path.join(CACHE_DIR, 'fxrates.parquet')
+
+# Return cached rates for the date range if a fresh copy covering it exists, else None
+def load_cached(start_date, end_date):
+    path = cache_path()
+    if not os.path.exists(path) or time.time() - os.path.getmtime(path) > MAX_AGE_SECONDS:
+        return None
+    try:
+        df = pd.read_parquet(path)
+    except Exception as e:
+        print(f"Ignoring unreadable cache {path}: {e}")
+        return None
+    covered = df.attrs.get('start_date'), df.attrs.get('end_date')
+    if None in covered or pd.Timestamp(start_date) < pd.Timestamp(covered[0]) or pd.Timestamp(end_date) > pd.Timestamp(covered[1]):
+        return None
+    df.attrs = {}
+    return df.loc[start_date:end_date]
+
+# Persist rates fetched for the date range (best effort)
+# Only call this for FRED data: CSV fallbacks are not cached so FRED is retried next run.
+def save_cache(df, start_date, end_date):
+    out = df.copy(deep=False)
+    out.attrs = {'start_date': str(start_date), 'end_date': str(end_date)}
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        out.to_parquet(cache_path())
+    except ImportError:
+        pass  # No Parquet engine installed
+    except OSError as e:
+        print(f"Could not write cache {CACHE_DIR}: {e}")
@@ -3,6 +3,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy import stats
 from datetime import datetime
+from data_cache import load_cached, save_cache
 
 # Fix for Python 3.12 distutils compatibility
 try:
@@ -12,8 +13,16 @@ except ImportError as e:
     print(f"pandas_datareader not available: {e}")
     PANDAS_DATAREADER_AVAILABLE = False
 
-# Step 1: Fetch data from FRED (or load from CSV if fetch fails)
+# Step 1: Fetch data from disk cache, else FRED (or load from CSV if fetch fails)
 def fetch_data(start_date='2000-01-01', end_date=datetime.now().strftime('%Y-%m-%d')):
+    df = load_cached(start_date, end_date)
+    if df is not None:
+        print(f"Loaded cached data. Rows: {len(df)}")
+        return df
+    return _load_rates(start_date, end_date)
+
+# Raw USD_MYR/USD_SGD rates from FRED, falling back to local CSVs
+def _load_rates(start_date, end_date):
     if PANDAS_DATAREADER_AVAILABLE:
         try:
             print("Fetching data from FRED...")
@@ -23,6 +32,7 @@ def fetch_data(start_date='2000-01-01', end_date=datetime.now().strftime('%Y-%m-
             sgd.columns = ['USD_SGD']
             df = pd.concat([myr, sgd], axis=1).dropna()
             print(f"Data fetched successfully from {start_date} to {end_date}. Rows: {len(df)}")
+            save_cache(df, start_date, end_date)
             return df
         except Exception as e:
             print(f"Error fetching from FRED: {e}")
@@ -91,27 +101,34 @@ def analyze_regimes(df):
     print("\n=== 4. Regime-Specific Analysis ===")
     print("Explanation: MYR/SGD shows regime shifts due to policy changes and crises. We analyze key periods to identify behavioral patterns.")
     
-    regimes = {
-        'Full (2000-2025)': df,
-        'Post-Peg (2005-2014)': df['2005-07-01':'2014-12-31'],
-        'Oil Crash/Recovery (2015-2020)': df['2015-01-01':'2020-12-31'],
-        'Post-COVID (2021-2025)': df['2021-01-01':]
-    }
-    
-    for name, sub_df in regimes.items():
-        if len(sub_df) < 100: 
-            continue
-            
-        # Calculate basic statistics for each regime
-        log_spread = np.log(sub_df['USD_MYR'] / sub_df['USD_SGD'])
-        volatility = log_spread.std() * np.sqrt(252)  # Annualized volatility
-        trend = (log_spread.iloc[-1] - log_spread.iloc[0]) / len(log_spread) * 252  # Annualized trend
-        
-        print(f"{name} - Volatility: {volatility:.3f}, Trend: {trend:+.3f}/year")
+    log_spread = np.log(df['USD_MYR'] / df['USD_SGD'])
+    
+    # Label each row with its sub-regime (contiguous, non-overlapping date bins)
+    regime_bins = pd.cut(
+        df.index,
+        bins=pd.to_datetime(['2005-07-01', '2015-01-01', '2021-01-01', pd.Timestamp.max]),
+        labels=['Post-Peg (2005-2014)', 'Oil Crash/Recovery (2015-2020)', 'Post-COVID (2021-2025)'],
+        right=False
+    )
+    
+    # One aggregation pass over the sub-regimes, plus the same stats for the full period
+    full = pd.DataFrame({'std': [log_spread.std()], 'first': [log_spread.iloc[0]],
+                         'last': [log_spread.iloc[-1]], 'size': [len(log_spread)]},
+                        index=['Full (2000-2025)'])
+    by_regime = log_spread.groupby(regime_bins, observed=True).agg(['std', 'first', 'last', 'size'])
+    regime_stats = pd.concat([full, by_regime])
+    regime_stats = regime_stats[regime_stats['size'] >= 100]
+    
+    # Calculate basic statistics for each regime
+    regime_stats['volatility'] = regime_stats['std'] * np.sqrt(252)  # Annualized volatility
+    regime_stats['trend'] = (regime_stats['last'] - regime_stats['first']) / regime_stats['size'] * 252  # Annualized trend
+    
+    for name, row in regime_stats.iterrows():
+        print(f"{name} - Volatility: {row['volatility']:.3f}, Trend: {row['trend']:+.3f}/year")
         
-        if abs(trend) < 0.1:
+        if abs(row['trend']) < 0.1:
             print(f"  -> Stable regime (suitable for mean-reversion)")
-        elif trend > 0.1:
+        elif row['trend'] > 0.1:
             print(f"  -> MYR weakening regime")
         else:
             print(f"  -> MYR strengthening regime")
@@ -9,6 +9,19 @@ import os
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+from backtest import (run_backtest, run_bt_fused, evaluate, precompute, grid_search, search, quick_sharpe, rolling_mean_std,
+                      ffill_with_exit, trade_stats, trade_markers, sweep_thresholds, _move_mean_std)
+
+
+def make_sample_data(n=400, seed=0):
+    """Synthetic mean-reverting MYR/SGD series"""
+    rng = np.random.default_rng(seed)
+    log_spread = np.zeros(n)
+    for i in range(1, n):
+        log_spread[i] = 0.95 * log_spread[i - 1] + rng.normal(0, 0.004)
+    index = pd.date_range('2021-03-01', periods=n, freq='B')
+    return pd.DataFrame({'MYR_SGD': 3.3 * np.exp(log_spread)}, index=index)
+
 
 class TestBacktesting:
     """Test cases for backtesting functionality"""
@@ -27,6 +40,28 @@ class TestBacktesting:
         assert len(zscore) == len(spread)
         assert zscore.isna().sum() == window - 1  # First window-1 should be NaN
     
+    def test_rolling_mean_std_matches_pandas(self):
+        """Test single-pass rolling kernel against pandas rolling mean/std"""
+        series = pd.Series(np.log(make_sample_data()['MYR_SGD']).to_numpy())
+        window = 30
+        mean, std = rolling_mean_std(series.to_numpy(), window)
+        
+        np.testing.assert_allclose(mean, series.rolling(window).mean().to_numpy(), rtol=1e-9, equal_nan=True)
+        np.testing.assert_allclose(std, series.rolling(window).std().to_numpy(), rtol=1e-6, equal_nan=True)
+    
+    def test_bottleneck_matches_rolling_kernel(self):
+        """Test bottleneck fast path agrees with the Welford kernel"""
+        pytest.importorskip('bottleneck')
+        x = np.log(make_sample_data()['MYR_SGD'].to_numpy())
+        
+        for expected, actual in zip(rolling_mean_std(x, 60), _move_mean_std(x, 60)):
+            np.testing.assert_allclose(actual, expected, rtol=1e-6, equal_nan=True)
+        
+        # Series shorter than the window: all NaN rather than a bottleneck ValueError
+        for expected, actual in zip(rolling_mean_std(x[:15], 20), _move_mean_std(x[:15], 20)):
+            assert np.isnan(actual).all()
+            np.testing.assert_array_equal(actual, expected)
+    
     def test_signal_generation(self):
         """Test trading signal generation"""
         # Create sample z-scores
@@ -48,6 +83,16 @@ class TestBacktesting:
         assert signals.iloc[0] == -1  # Short signal
         assert signals.iloc[1] == 1   # Long signal
     
+    def test_ffill_with_exit(self):
+        """Test positions are held until the z-score re-enters the exit band"""
+        zscore = np.array([np.nan, 2.5, 1.0, 0.2, -2.5, -1.0, 2.5])
+        raw = (zscore < -2.0).astype(np.int8) - (zscore > 2.0).astype(np.int8)
+        exit_mask = np.abs(zscore) < 0.5
+        
+        signal = ffill_with_exit(raw, exit_mask)
+        assert signal.dtype == np.int8
+        assert signal.tolist() == [0, -1, -1, 0, 1, 1, -1]
+    
     def test_performance_metrics(self):
         """Test performance metrics calculation"""
         # Create sample returns
@@ -89,6 +134,154 @@ class TestBacktesting:
         assert max_dd <= 0  # Drawdown should be negative or zero
         assert not np.isnan(max_dd)
 
+    
+    def test_run_backtest_counts_entries(self):
+        """Test number of trades counts flat-to-position transitions only"""
+        metrics, series = run_backtest(make_sample_data()['MYR_SGD'].to_numpy(), 20, 1.5, 0.25, return_series=True)
+        
+        positions = series['signal'] != 0
+        n_entries = np.count_nonzero(positions[1:] & ~positions[:-1])
+        assert metrics['num_trades'] == n_entries > 0
+        assert series['cum_ret'][-1] == pytest.approx(metrics['total_return'])
+    
+    def test_trade_stats(self):
+        """Test single-pass trade statistics on a hand-built position path"""
+        signal = np.array([0, 1, 1, 0, 0, -1, -1, 0], dtype=float)
+        strategy_ret = np.array([np.nan, 0.0, 0.01, 0.02, 0.0, 0.0, -0.01, -0.005])
+        
+        num_trades, avg_duration, win_rate, avg_win, avg_loss = trade_stats(signal, strategy_ret)
+        assert num_trades == 2
+        assert avg_duration == 2
+        assert win_rate == 0.5
+        assert avg_win == pytest.approx(0.03)
+        assert avg_loss == pytest.approx(-0.015)
+    
+    def test_trade_markers(self):
+        """Test entry/exit edge detection on the signal array"""
+        signal = np.array([0, 1, 1, 0, -1, -1, 0, 0, 1], dtype=np.int8)
+        
+        entry_long, entry_short, exits = trade_markers(signal)
+        assert entry_long.tolist() == [1, 8]
+        assert entry_short.tolist() == [4]
+        assert exits.tolist() == [3, 6]
+    
+    def test_run_backtest_shorter_than_window(self):
+        """Test a series shorter than the window yields no trades instead of raising"""
+        metrics = run_backtest(make_sample_data()['MYR_SGD'].to_numpy()[:15], 20, 1.5, 0.25)
+        assert metrics['num_trades'] == 0
+        assert metrics['total_return'] == 0
+    
+    def test_trade_returns_partition_total(self):
+        """Test per-trade returns add up to the strategy's total return"""
+        metrics = run_backtest(make_sample_data()['MYR_SGD'].to_numpy(), 20, 1.5, 0.25)
+        
+        n_trades = metrics['num_trades']
+        n_wins = round(metrics['win_rate'] * n_trades)
+        trade_total = n_wins * metrics['avg_win'] + (n_trades - n_wins) * metrics['avg_loss']
+        assert trade_total == pytest.approx(metrics['total_return'])
+    
+    def test_fused_backtest_matches_run_backtest(self):
+        """Test the fused single-pass kernel reproduces run_backtest metrics"""
+        prices = make_sample_data(n=600)['MYR_SGD'].to_numpy()
+        
+        for params in [(20, 1.5, 0.0), (40, 2.0, 0.5), (60, 1.75, 0.25)]:
+            metrics = run_backtest(prices, *params)
+            sharpe, sortino, max_dd, num_trades = run_bt_fused(prices, *params, 0.0002)
+            assert sharpe == pytest.approx(metrics['sharpe'], rel=1e-5)
+            assert sortino == pytest.approx(metrics['sortino'], rel=1e-5)
+            assert max_dd == pytest.approx(metrics['max_dd'], rel=1e-5)
+            assert num_trades == metrics['num_trades']
+        assert run_bt_fused(prices[:5], 2, 1.0, 0.0, 0.0002)[0] == -np.inf
+    
+    def test_grid_search_matches_run_backtest(self):
+        """Test vectorized grid search reproduces per-combination backtests"""
+        prices = make_sample_data()['MYR_SGD'].to_numpy()
+        results = grid_search(prices, [20, 40], [1.5, 2.0], [0.0, 0.5])
+        
+        assert len(results) == 8
+        for row in results.itertuples():
+            metrics = run_backtest(prices, row.window, row.entry_z, row.exit_z)
+            assert row.sharpe == pytest.approx(metrics['sharpe'], rel=1e-6)
+    
+    def test_sweep_thresholds(self):
+        """Test threshold sweep matches evaluate() and scores invalid cells -inf"""
+        pre = precompute(make_sample_data()['MYR_SGD'].to_numpy(), 30)
+        entries = np.array([0.5, 1.5, 2.0])
+        exits = np.array([0.0, 0.5])
+        
+        sharpe = sweep_thresholds(pre['zscore'], pre['spread_ret'], entries, exits, 0.0002)
+        assert sharpe.shape == (3, 2)
+        assert sharpe[0, 1] == -np.inf
+        assert sharpe[2, 1] == pytest.approx(evaluate(pre, 2.0, 0.5)['sharpe'], rel=1e-6)
+    
+    def test_float32_sharpe_matches_float64(self):
+        """Test float32 analytics arrays keep Sharpe within 1e-4 of float64"""
+        pre = precompute(make_sample_data(n=800)['MYR_SGD'].to_numpy(), 40)
+        assert pre['zscore'].dtype == np.float32
+        pre64 = dict(pre,
+                     zscore=(pre['log_spread'] - pre['mean']) / pre['std'],
+                     spread_ret=np.diff(pre['log_spread'], prepend=np.nan))
+        
+        for entry_z, exit_z in [(1.5, 0.0), (2.0, 0.5)]:
+            sharpe32 = evaluate(pre, entry_z, exit_z)['sharpe']
+            sharpe64 = evaluate(pre64, entry_z, exit_z)['sharpe']
+            assert sharpe32 == pytest.approx(sharpe64, rel=1e-4)
+    
+    def test_grid_search_skips_invalid_pairs(self):
+        """Test combinations with exit_z >= entry_z are not evaluated"""
+        results = grid_search(make_sample_data()['MYR_SGD'].to_numpy(), [20], [0.5, 1.5], [0.0, 0.5, 1.0])
+        
+        assert len(results) == 4
+        assert (results['exit_z'] < results['entry_z']).all()
+    
+    def test_search_refines_best_point(self):
+        """Test random search is followed by a fine grid around its best point"""
+        prices = make_sample_data()['MYR_SGD'].to_numpy()
+        results = search(prices, [30, 60], [1.5, 2.0], [0.0, 0.5], n_iter=3, seed=0)
+        coarse_best = results.iloc[:3].loc[results['sharpe'].iloc[:3].idxmax()]
+        
+        assert not results.duplicated(['window', 'entry_z', 'exit_z']).any()
+        assert (results['exit_z'] < results['entry_z']).all()
+        fine = results.iloc[3:]
+        assert set(fine['window']) <= {coarse_best['window'] - 15, coarse_best['window'], coarse_best['window'] + 15}
+        assert (fine['entry_z'] - coarse_best['entry_z']).abs().max() == pytest.approx(0.125)
+    
+    def test_quick_sharpe_uses_sample_head(self):
+        """Test the quick Sharpe proxy backtests only the head of the sample"""
+        prices = make_sample_data(n=1000)['MYR_SGD'].to_numpy()
+        
+        assert quick_sharpe(prices, 20, 2.0, 0.5) == pytest.approx(run_backtest(prices[:100], 20, 2.0, 0.5)['sharpe'], rel=1e-5)
+        assert quick_sharpe(prices, 60, 2.0, 0.5) == pytest.approx(run_backtest(prices[:120], 60, 2.0, 0.5)['sharpe'], rel=1e-5)
+        assert quick_sharpe(prices, 20, 2.0, 0.5, n_head=120) == pytest.approx(run_backtest(prices[:120], 20, 2.0, 0.5)['sharpe'], rel=1e-5)
+    
+    def test_search_prefilter_keeps_top_k(self):
+        """Test only the top_k quick-Sharpe candidates reach the full backtest"""
+        prices = make_sample_data()['MYR_SGD'].to_numpy()
+        cache = {}
+        search(prices, [20, 40, 60, 80], [1.5, 2.0], [0.0, 0.5], n_iter=16, top_k=1, cache=cache, seed=0)
+        
+        # One coarse candidate survives, so only its window and the fine-grid neighbours are computed
+        assert len(cache) <= 3
+    
+    def test_grid_search_cache_reuse(self):
+        """Test cached window statistics can be re-evaluated after the search"""
+        prices = make_sample_data()['MYR_SGD'].to_numpy()
+        cache = {}
+        grid_search(prices, [20, 40], [1.5, 2.0], [0.0, 0.5], cache=cache)
+        
+        assert sorted(cache) == [20, 40]
+        cached_metrics = evaluate(cache[40], 2.0, 0.5)
+        metrics = run_backtest(prices, 40, 2.0, 0.5)
+        assert cached_metrics == metrics
+    
+    def test_grid_search_parallel(self):
+        """Test parallel grid search gives the same results as serial"""
+        prices = make_sample_data()['MYR_SGD'].to_numpy()
+        serial = grid_search(prices, [20, 40], [1.5, 2.0], [0.0, 0.5])
+        parallel = grid_search(prices, [20, 40], [1.5, 2.0], [0.0, 0.5], n_jobs=2)
+        
+        pd.testing.assert_frame_equal(serial, parallel)
+
 
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -9,6 +9,8 @@ import os
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+import data_cache
+
 
 class TestDataProcessing:
     """Test cases for data loading and processing"""
@@ -92,6 +94,46 @@ class TestDataProcessing:
         assert myr_data.index.year.min() >= 2000
         assert myr_data.index.year.max() >= 2020  # Should have recent data
 
+    
+    def test_parquet_cache_round_trip(self, tmp_path, monkeypatch):
+        """Test cached rates are reused while fresh and ignored once stale"""
+        pytest.importorskip('pyarrow')
+        monkeypatch.setattr(data_cache, 'CACHE_DIR', str(tmp_path))
+        index = pd.date_range('2021-03-01', periods=5, freq='B', name='observation_date')
+        df = pd.DataFrame({'USD_MYR': [4.1, 4.2, 4.1, 4.0, 4.1], 'USD_SGD': [1.33, 1.34, 1.35, 1.34, 1.33]}, index=index)
+        
+        assert data_cache.load_cached('2021-03-01', '2021-03-05') is None
+        data_cache.save_cache(df, '2021-03-01', '2021-03-05')
+        pd.testing.assert_frame_equal(data_cache.load_cached('2021-03-01', '2021-03-05'), df, check_freq=False)
+        
+        path = data_cache.cache_path()
+        stale = os.path.getmtime(path) - data_cache.MAX_AGE_SECONDS - 1
+        os.utime(path, (stale, stale))
+        assert data_cache.load_cached('2021-03-01', '2021-03-05') is None
+    
+    def test_parquet_cache_serves_covered_ranges(self, tmp_path, monkeypatch):
+        """Test one cache file serves any sub-range of the fetched range and nothing wider"""
+        pytest.importorskip('pyarrow')
+        monkeypatch.setattr(data_cache, 'CACHE_DIR', str(tmp_path))
+        index = pd.date_range('2021-03-01', periods=5, freq='B', name='observation_date')
+        df = pd.DataFrame({'USD_MYR': [4.1, 4.2, 4.1, 4.0, 4.1], 'USD_SGD': [1.33, 1.34, 1.35, 1.34, 1.33]}, index=index)
+        data_cache.save_cache(df, '2021-02-27', '2021-03-07')
+        
+        pd.testing.assert_frame_equal(data_cache.load_cached('2021-03-02', '2021-03-04'), df.iloc[1:4], check_freq=False)
+        assert data_cache.load_cached('2021-02-01', '2021-03-04') is None
+        assert data_cache.load_cached('2021-03-02', '2021-03-31') is None
+        assert os.listdir(tmp_path) == ['fxrates.parquet']
+    
+    def test_save_cache_ignores_unwritable_dir(self, tmp_path, monkeypatch):
+        """Test a cache directory that cannot be created does not raise"""
+        blocker = tmp_path / 'not_a_dir'
+        blocker.write_text('')
+        monkeypatch.setattr(data_cache, 'CACHE_DIR', str(blocker / 'cache'))
+        df = pd.DataFrame({'USD_MYR': [4.1], 'USD_SGD': [1.33]})
+        
+        data_cache.save_cache(df, '2021-03-01', '2021-03-05')
+        assert data_cache.load_cached('2021-03-01', '2021-03-05') is None
+
 
 if __name__ == "__main__":
     pytest.main([__file__])